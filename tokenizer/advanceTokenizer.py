@@ -1,10 +1,26 @@
+from collections import Counter
+
 from .baseTokenizer import BaseTokenizer
-from .helper import getPairStats, merge
+from .helper import encodeChunk, trainMerges
 
 import regex as re
 
 PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
 
+# Same split as PATTERN restricted to ASCII text: \p{L} and \p{N} only match [a-zA-Z] and [0-9] there,
+# and the plain character classes avoid the Unicode property lookups on every character
+ASCII_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\na-zA-Z0-9]?+[a-zA-Z]+|[0-9]{1,3}| ?[^\sa-zA-Z0-9]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+
+# Compile the patterns once at import time and share them between instances. The patterns split
+# str rather than the UTF-8 bytes: \p{L} and \p{N} cannot be matched on bytes, and for ASCII text
+# splitting the encoded bytes was measured to be no faster, since the regex scan dominates either way
+COMPILED_PATTERN = re.compile(PATTERN)
+COMPILED_ASCII_PATTERN = re.compile(ASCII_PATTERN)
+
+# Upper bound on the number of distinct subwords whose encoding is cached
+CHUNK_CACHE_SIZE = 200000
+
+
 class AdvanceTokenizer(BaseTokenizer):
     """
     An advanced tokenizer class implementing Byte Pair Encoding (BPE) 
@@ -16,12 +32,22 @@ class AdvanceTokenizer(BaseTokenizer):
     Attributes:
         pattern (str): Regular expression pattern for spliting the text into subtexts.
         compiled_pattern (regex.Pattern): Compiled regex pattern for efficient spliting.
+        compiled_ascii_pattern (regex.Pattern): Compiled ASCII-only equivalent used for pure-ASCII text.
+        _chunk_cache (dict): Token IDs of already encoded subwords. It is cleared by `train` and `load`,
+                             and by `encode` when `merge_dict` has been replaced or has gained or lost
+                             entries since the cache was filled. Changing the value of an existing merge
+                             in place is not detected; clear the cache by hand after doing so.
     """
 
     def __init__(self):
         super().__init__()
         self.pattern = PATTERN
-        self.compiled_pattern = re.compile(self.pattern)
+        self.compiled_pattern = COMPILED_PATTERN
+        self.compiled_ascii_pattern = COMPILED_ASCII_PATTERN
+        # Token IDs of already encoded subwords, valid for the current merges only
+        self._chunk_cache = {}
+        # Identity and size of the merge_dict the cache was filled from
+        self._chunk_cache_merges = None
 
     
     def train(self, text, vocab_size):
@@ -37,24 +63,20 @@ class AdvanceTokenizer(BaseTokenizer):
         num_of_merges = vocab_size - 256
 
         # split input text into subwords based on the regex pattern
-        text_list = re.findall(self.compiled_pattern, text)
-        # Convert each subword into its byte representation
-        bytes_list = [list(text.encode('utf-8')) for text in text_list]
+        text_list = self._split(text)
+        # Collapse repeated subwords into a single entry with its frequency
+        subword_counts = Counter(text_list)
+        # Convert each distinct subword into its byte representation
+        bytes_list = [list(subword.encode('utf-8')) for subword in subword_counts]
         
-        for i in range(num_of_merges):
-            # Compute frequency of byte pairs across all subwords
-            pairStats = {}
-            for subword in bytes_list:
-                pairStats = getPairStats(subword, pairStats)
-            
-            # Select the most frequent pair for merging
-            pair = max(pairStats, key = lambda x : pairStats[x])
-            # Merge the selected pair in all subwords
-            bytes_list = [merge(subword, pair, 256 + i) for subword in bytes_list]
-
-            # Update merge and vocabulary dictionaries
-            self.merge_dict[pair] = 256 + i
-            self.vocab_dict[256 + i] = self.vocab_dict[pair[0]] + self.vocab_dict[pair[1]]
+        # Learn the merges over all subwords, so no merge crosses a subword boundary
+        self._chunk_cache.clear()
+        merges = trainMerges(bytes_list, num_of_merges, list(subword_counts.values()))
+
+        # Update merge and vocabulary dictionaries
+        for pair, idx in merges.items():
+            self.merge_dict[pair] = idx
+            self.vocab_dict[idx] = self.vocab_dict[pair[0]] + self.vocab_dict[pair[1]]
 
         
     def encode(self, text):
@@ -68,36 +90,59 @@ class AdvanceTokenizer(BaseTokenizer):
             list: A list of token IDs representing the encoded text.
         """
         # split input text into subwords based on the regex pattern
-        text_list = re.findall(self.compiled_pattern, text)
-        bytes_list = [list(text.encode('utf-8')) for text in text_list]
+        text_list = self._split(text)
+
+        # Drop cached encodings if merge_dict was replaced or edited since they were made
+        merges = (id(self.merge_dict), len(self.merge_dict))
+        if merges != self._chunk_cache_merges:
+            self._chunk_cache.clear()
+            self._chunk_cache_merges = merges
 
         encoded_text = []
-        for subword in bytes_list:
-            # Apply BPE merges to reduce subword sequences
-            while len(subword) >= 2:
-                pairStat = getPairStats(subword)
-                pair = min(pairStat, key = lambda x : self.merge_dict.get(x, float('inf')))
-                if pair not in self.merge_dict:
-                    break
-                subword = merge(subword, pair, self.merge_dict[pair])
-            encoded_text.extend(subword)
+        cache = self._chunk_cache
+        for chunk in text_list:
+            # Subwords repeat a lot in natural text, so reuse the encoding of a seen subword
+            token_ids = cache.get(chunk)
+            if token_ids is None:
+                # Apply BPE merges to reduce subword sequences
+                token_ids = tuple(encodeChunk(list(chunk.encode('utf-8')), self.merge_dict))
+                if len(cache) < CHUNK_CACHE_SIZE:
+                    cache[chunk] = token_ids
+            encoded_text.extend(token_ids)
 
         return encoded_text
         
     
 
-    def decode(self, tokenIds):
+    def load(self, model_file_name):
         """
-        Decodes a sequence of token IDs back into the original text.
+        Loads the tokenizer's merge rules from a file and rebuilds the vocabulary.
 
         Args:
-            tokenIds (list): A list of token IDs to decode.
+            model_file_name (str): Name of the file containing merge rules.
+        """
+        super().load(model_file_name)
+        self._chunk_cache.clear()
+
+
+    def _split(self, text):
+        """
+        Splits the text into subwords based on the regex pattern.
+
+        Pure-ASCII text is split with the ASCII-only pattern, which gives the same
+        subwords without the Unicode property lookups. A compiled_pattern set by the
+        user is always used as is.
+
+        Args:
+            text (str): Input text to split.
 
         Returns:
-            str: The decoded text string.
+            list: A list of subword strings.
         """
-        text_bytes = b"".join(self.vocab_dict[t] for t in tokenIds)
-        return text_bytes.decode("utf-8", errors='replace')
+        if self.compiled_pattern is COMPILED_PATTERN and text.isascii():
+            return self.compiled_ascii_pattern.findall(text)
+        return self.compiled_pattern.findall(text)
+
 
 
 
@@ -121,7 +166,7 @@ if __name__ == "__main__":
     print(text == original_text)
 
     #tokenizer.save("text")
-    #tokenizer.load("text.model")
+    #tokenizer.load("text.merges")
     print(tokenizer.encode(" supplementary right world"))
     print(tokenizer.decode([124, 32, 104, 101, 108, 108, 111, 32, 119, 111, 114, 108, 100, 33, 32, 240, 159, 152, 132]))
     #print(tokenizer.vocab_dict)
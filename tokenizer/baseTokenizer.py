@@ -1,3 +1,9 @@
+import struct
+
+# One merge rule in the `.merges` file: little-endian int32 (p0, p1, idx)
+MERGE_RECORD = struct.Struct("<3i")
+
+
 class BaseTokenizer:
     """
     A base class for building and training custom tokenizers.
@@ -68,7 +74,9 @@ class BaseTokenizer:
         Returns:
             str: The decoded text string.
         """
-        text_bytes = b"".join(self.vocab_dict[t] for t in tokenIds)
+        # Join a list rather than a generator so the result is sized in one go
+        vocab_dict = self.vocab_dict
+        text_bytes = b"".join([vocab_dict[t] for t in tokenIds])
         decoded_text = text_bytes.decode("utf-8", errors='replace')
         return decoded_text
 
@@ -103,16 +111,16 @@ class BaseTokenizer:
         Args:
             file_name (str): Base name for the files to save the tokenizer data.
                             Two files will be created:
-                            - `file_name.model`: Contains the merge rules.
+                            - `file_name.merges`: Contains the merge rules as a flat binary array of
+                              little-endian int32 triples (p0, p1, idx).
                             - `file_name.vocab`: Contains the vocabulary.
         """
 
-        # Save merge rules
-        model_file = file_name + ".model"
-        with open(model_file, "w") as file:   
-            for key, value in self.merge_dict.items():
-                p0, p1 = key
-                file.write(f"{p0} {p1} {value}\n")
+        # Save merge rules in one binary write instead of a text line per merge
+        merges = b"".join([MERGE_RECORD.pack(p0, p1, idx) for (p0, p1), idx in self.merge_dict.items()])
+        merges_file = file_name + ".merges"
+        with open(merges_file, "wb") as file:
+            file.write(merges)
 
         # Save vocabulary
         vocab_file = file_name + ".vocab"
@@ -125,13 +133,36 @@ class BaseTokenizer:
         Loads the tokenizer's merge rules from a file and rebuilds the vocabulary.
 
         Args:
-            model_file_name (str): Name of the file containing merge rules.
+            model_file_name (str): Name of the file containing merge rules. Files ending in `.model`
+                                   are read in the older text format with one `p0 p1 idx` line per
+                                   merge; any other file is read in the binary `.merges` format.
+
+        Raises:
+            ValueError: If a binary file is truncated, or holds a merge whose new token is below 256
+                        or whose pair uses a token that no earlier merge has created.
         """
 
-        with open(model_file_name, "r", encoding='utf-8') as file:
-            for line in file:
-                p0, p1, idx = line.split()
-                self.merge_dict[(int(p0), int(p1))] = int(idx)
+        if model_file_name.endswith(".model"):
+            with open(model_file_name, "r", encoding='utf-8') as file:
+                for line in file:
+                    p0, p1, idx = line.split()
+                    self.merge_dict[(int(p0), int(p1))] = int(idx)
+        else:
+            with open(model_file_name, "rb") as file:
+                merges = file.read()
+            if len(merges) % MERGE_RECORD.size != 0:
+                raise ValueError(f"{model_file_name} does not contain whole (p0, p1, idx) triples")
+
+            # Every merge must create a new token out of two tokens that already exist, which
+            # also rejects text files that happen to have a length divisible by the record size
+            known = set(range(256))
+            merge_dict = {}
+            for p0, p1, idx in MERGE_RECORD.iter_unpack(merges):
+                if idx < 256 or p0 not in known or p1 not in known:
+                    raise ValueError(f"{model_file_name} contains an invalid merge ({p0}, {p1}) -> {idx}")
+                known.add(idx)
+                merge_dict[(p0, p1)] = idx
+            self.merge_dict.update(merge_dict)
 
         self.vocab_dict = self._build_vocab_dict()
        
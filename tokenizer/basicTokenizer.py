@@ -1,5 +1,5 @@
 from .baseTokenizer import BaseTokenizer
-from .helper import getPairStats, merge
+from .helper import encodeChunk, trainMerges
 
 class BasicTokenizer(BaseTokenizer):
     """
@@ -51,21 +51,15 @@ class BasicTokenizer(BaseTokenizer):
         # Convert the input text to a list of byte values
         byte_ids = list(text.encode("utf-8"))
 
-        for i in range(num_of_merges):
-            # Compute the frequency of all consecutive byte pairs
-            pairStats = getPairStats(byte_ids)
-
-            # Find the most frequent byte pair
-            pair = max(pairStats, key=lambda x: pairStats[x])
-
-            # Replace all occurrences of this pair with a new token
-            byte_ids = merge(byte_ids, pair, 256 + i)
+        # Learn the merges over the whole text as a single sequence
+        merges = trainMerges([byte_ids], num_of_merges)
 
+        for pair, idx in merges.items():
             # Update the merge dictionary to track this new token
-            self.merge_dict[pair] = 256 + i
+            self.merge_dict[pair] = idx
 
             # Update the vocabulary dictionary with the new token and its corresponding bytes
-            self.vocab_dict[256 + i] = self.vocab_dict[pair[0]] + self.vocab_dict[pair[1]]
+            self.vocab_dict[idx] = self.vocab_dict[pair[0]] + self.vocab_dict[pair[1]]
 
     def encode(self, text):
         """
@@ -84,39 +78,11 @@ class BasicTokenizer(BaseTokenizer):
         text_bytes = text.encode("utf-8")
         byte_ids = list(text_bytes)
 
-        while len(byte_ids) >= 2:
-            # Compute the frequency of all consecutive byte pairs in the current byte list
-            pairStats = getPairStats(byte_ids)
-
-            # Find the first pair that exists in the merge dictionary (smallest token ID)
-            pair = min(pairStats, key=lambda x: self.merge_dict.get(x, float('inf')))
-
-            # If the pair is not in the merge dictionary, stop the encoding process
-            if pair not in self.merge_dict:
-                break
-
-            # Replace the found pair with its corresponding token ID
-            byte_ids = merge(byte_ids, pair, self.merge_dict[pair])
+        # Apply the learned merges in the order they were learned
+        byte_ids = encodeChunk(byte_ids, self.merge_dict)
 
         return byte_ids
 
-    def decode(self, tokenIds):
-        """
-        Decodes a sequence of token IDs back into the original text.
-
-        Args:
-            tokenIds (list): A list of token IDs to decode.
-
-        Returns:
-            str: The decoded text string.
-        """
-        # Reconstruct the byte sequence from the token IDs using the vocabulary dictionary
-        text_bytes = b"".join(self.vocab_dict[t] for t in tokenIds)
-
-        # Decode the byte sequence into a UTF-8 string, replacing invalid characters if necessary
-        decoded_text = text_bytes.decode("utf-8", errors='replace')
-        return decoded_text
-
 
 if __name__ == "__main__":
     # Example usage of the BasicTokenizer
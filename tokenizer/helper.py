@@ -1,45 +1,65 @@
 # Helper functions for Byte Pair Encoding (BPE) Tokenization   
 
+from collections import Counter, defaultdict
+from heapq import heapify, heappop, heappush
 
-def getPairStats(byteList, pairStats = None):
+def getPairStats(byteList):
     """
     Computes the frequency of consecutive byte pairs in a given list.
 
-    This function iterates through a list of bytes and calculates how often 
-    each pair of consecutive bytes occurs, storing the result in a dictionary. 
-    If an existing `pairStats` dictionary is provided, it updates the counts 
-    within that dictionary instead of creating a new one.
+    This function pairs every element of a list with its successor and counts 
+    the pairs with a `Counter`, so the whole loop runs in C instead of Python. 
+    Use `updatePairStats` to add the pairs of several lists into one counter.
 
     Args:
         byteList (list): A list of bytes (or integers representing byte values) 
                          for which to compute pair frequencies.
-        pairStats (dict, optional): An existing dictionary to update with 
-                                    the frequency of byte pairs. Defaults to None,
-                                    in which case a new dictionary is created.
 
     Returns:
-        dict: A dictionary where keys are tuples representing consecutive byte pairs,
-              and values are the frequencies of those pairs in the input list.
+        Counter: A counter where keys are tuples representing consecutive byte pairs,
+                 and values are the frequencies of those pairs in the input list.
+                 Pairs are kept in order of their first occurrence.
 
     Example:
         >>> byteList = [1, 2, 1, 2, 1, 3]
         >>> getPairStats(byteList)
-        {(1, 2): 2, (2, 1): 2, (1, 3): 1}
+        Counter({(1, 2): 2, (2, 1): 2, (1, 3): 1})
+    """
+    return Counter(zip(byteList, byteList[1:]))
+
 
-        >>> existingStats = {(1, 2): 1}
-        >>> getPairStats([1, 2, 1], pairStats=existingStats)
-        {(1, 2): 2, (2, 1): 1}
+def updatePairStats(byteList, pairStats, weight = 1):
     """
-    pairStats = {} if pairStats is None else pairStats
-    for i in range(len(byteList) - 1):
-        pair = (byteList[i], byteList[i + 1])
-        if pair in pairStats:
-            pairStats[pair] += 1
-        else:
-            pairStats[pair] = 1
+    Adds the frequency of consecutive byte pairs in a given list to an existing counter.
 
-    return pairStats
+    A `weight` counts every pair that many times, for a list standing in for 
+    several identical ones. Unweighted lists are counted with `Counter.update`, 
+    which runs the loop in C.
 
+    Args:
+        byteList (list): A list of bytes (or integers representing byte values) 
+                         for which to compute pair frequencies.
+        pairStats (Counter): The counter to update with the frequency of byte pairs.
+        weight (int, optional): The amount added per pair occurrence. Defaults to 1.
+
+    Returns:
+        None: `pairStats` is updated in place.
+
+    Example:
+        >>> existingStats = Counter({(1, 2): 1})
+        >>> updatePairStats([1, 2, 1], existingStats)
+        >>> existingStats
+        Counter({(1, 2): 2, (2, 1): 1})
+
+        >>> updatePairStats([1, 2, 1], existingStats, weight=3)
+        >>> existingStats
+        Counter({(1, 2): 5, (2, 1): 4})
+    """
+    if weight == 1:
+        pairStats.update(zip(byteList, byteList[1:]))
+    else:
+        for pair in zip(byteList, byteList[1:]):
+            pairStats[pair] += weight
 
 
 def merge(oldList, pair, idx):
@@ -47,7 +67,9 @@ def merge(oldList, pair, idx):
     Merges occurrences of a specified pair of elements in a list into a single new element.
 
     This function scans through a list and replaces consecutive occurrences of a given pair 
-    with a specified value. Any other elements in the list remain unchanged.
+    with a specified value. Any other elements in the list remain unchanged. The scan jumps
+    between occurrences of the pair's first element with `list.index` and copies the runs in
+    between as slices, so the per-element work happens in C rather than in Python.
 
     Args:
         oldList (list): The original list of elements to process.
@@ -55,7 +77,8 @@ def merge(oldList, pair, idx):
         idx: The value to replace the pair with when it is found.
 
     Returns:
-        list: A new list where all instances of the specified pair are replaced by `idx`.
+        list: A new list where all instances of the specified pair are replaced by `idx`,
+              or `oldList` itself if the pair does not occur in it.
 
     Example:
         >>> oldList = [1, 2, 3, 1, 2, 4]
@@ -64,30 +87,346 @@ def merge(oldList, pair, idx):
         >>> merge(oldList, pair, idx)
         [99, 3, 99, 4]
     """
+    first, second = pair
+    if first not in oldList:
+        return oldList
+
+    last = len(oldList) - 1
     newList = []
-    i = 0
+    start = i = 0
+
+    while True:
+        # Jump to the next candidate with the C-level list.index instead of stepping element by element
+        try:
+            i = oldList.index(first, i, last)
+        except ValueError:
+            break
 
-    while i < len(oldList):
-        if i < len(oldList) - 1 and oldList[i] == pair[0] and oldList[i + 1] == pair[1]:
+        if oldList[i + 1] == second:
+            # Copy the untouched run in one slice, then emit the merged token
+            newList.extend(oldList[start:i])
             newList.append(idx)
-            i += 2
+            start = i = i + 2
         else:
-            newList.append(oldList[i])
             i += 1
+
+    if start == 0:
+        return oldList
+
+    newList.extend(oldList[start:])
+    return newList
+
+
+def mergeAndUpdate(oldList, pair, idx, pairStats, weight = 1, newPairs = None):
+    """
+    Merges occurrences of a pair like `merge`, while updating the pair frequencies in place.
+
+    Only the pairs around a merged occurrence change, so instead of recounting the whole
+    list after a merge, this function decrements the pairs destroyed by each merge and 
+    increments the pairs created by it. The left neighbour is always handled here, while 
+    the right neighbour is skipped when it starts another occurrence of the pair, since 
+    that occurrence accounts for it as its own left neighbour. Every change is scaled 
+    by `weight`, the number of times the list occurs in the corpus.
+
+    Args:
+        oldList (list): The original list of elements to process.
+        pair (tuple): A tuple containing two elements to search for in consecutive positions.
+        idx: The value to replace the pair with when it is found.
+        pairStats (Counter): Pair frequencies of the lists being merged, updated in place.
+        weight (int, optional): The number of times `oldList` occurs. Defaults to 1.
+        newPairs (set, optional): If given, the pairs created by the merge are added to it.
+
+    Returns:
+        list: A new list where all instances of the specified pair are replaced by `idx`,
+              or `oldList` itself if the pair does not occur in it.
+
+    Example:
+        >>> pairStats = getPairStats([1, 2, 3, 1, 2, 4])
+        >>> mergeAndUpdate([1, 2, 3, 1, 2, 4], (1, 2), 99, pairStats)
+        [99, 3, 99, 4]
+        >>> +pairStats
+        Counter({(99, 3): 1, (3, 99): 1, (99, 4): 1})
+    """
+    first, second = pair
+    if first not in oldList:
+        return oldList
+
+    last = len(oldList) - 1
+    newList = []
+    start = i = 0
+
+    while True:
+        # Scanning a packed (first << 16 | second) buffer costs a full rebuild per merge, more than it saves
+        try:
+            i = oldList.index(first, i, last)
+        except ValueError:
+            break
+
+        if oldList[i + 1] != second:
+            i += 1
+            continue
+
+        newList.extend(oldList[start:i])
+        pairStats[pair] -= weight
+
+        # Left neighbour: (prev, first) becomes (prev, idx)
+        if newList:
+            pairStats[(oldList[i - 1], first)] -= weight
+            pairStats[(newList[-1], idx)] += weight
+            if newPairs is not None:
+                newPairs.add((newList[-1], idx))
+
+        # Right neighbour: (second, next) becomes (idx, next), unless next starts another match
+        if i + 2 <= last:
+            nxt = oldList[i + 2]
+            if not (nxt == first and i + 3 <= last and oldList[i + 3] == second):
+                pairStats[(second, nxt)] -= weight
+                pairStats[(idx, nxt)] += weight
+                if newPairs is not None:
+                    newPairs.add((idx, nxt))
+
+        newList.append(idx)
+        start = i = i + 2
+
+    if start == 0:
+        return oldList
+
+    newList.extend(oldList[start:])
     return newList
 
+
+def trainMerges(idLists, num_of_merges, frequencies = None):
+    """
+    Learns Byte Pair Encoding (BPE) merges over one or more lists of token IDs.
+
+    This is the training core shared by the tokenizers. The pair frequencies are 
+    counted once over all lists, then each iteration picks the most frequent pair 
+    and merges it everywhere with `mergeAndUpdate`, which keeps the counts current 
+    without another full pass. The most frequent pair is taken from a max-heap 
+    instead of scanning all pairs: entries whose count went down since they were 
+    pushed are re-pushed with their current count when popped, and pairs created 
+    by a merge are pushed right away. Ties go to the smallest pair.
+
+    An index from each pair to the lists containing it limits every merge to the 
+    lists where the pair occurs, rather than visiting every list. Lists that gain 
+    a pair through a merge are added to its entry; entries of lists that lost a 
+    pair are left in place, since merging a list without the pair is a no-op.
+
+    Pairs never span two lists, so a tokenizer can pass a single list for the whole 
+    text or one list per distinct regex chunk, together with how often each chunk 
+    occurs, so repeated chunks are only processed once.
+
+    Args:
+        idLists (list): A list of lists of token IDs (initially byte values) to train on.
+        num_of_merges (int): The number of merges to learn.
+        frequencies (list, optional): The number of occurrences of each list in `idLists`.
+                                      Defaults to None, in which case each list counts once.
+
+    Returns:
+        dict: A dictionary mapping each merged pair to its new token ID (256, 257, ...),
+              in the order the merges were learned. Training stops early if no pairs
+              are left to merge.
+
+    Example:
+        >>> trainMerges([[97, 97, 97, 98, 100, 97, 97, 97, 98, 97, 99]], 2)
+        {(97, 97): 256, (97, 98): 257}
+    """
+    if frequencies is None:
+        frequencies = [1] * len(idLists)
+
+    # Count the pairs of every list into one counter, weighted by the list's frequency
+    pairStats = Counter()
+    for ids, freq in zip(idLists, frequencies):
+        updatePairStats(ids, pairStats, freq)
+
+    # Index the lists each pair occurs in
+    pairLists = defaultdict(set)
+    for listIdx, ids in enumerate(idLists):
+        for pair in zip(ids, ids[1:]):
+            pairLists[pair].add(listIdx)
+
+    idLists = list(idLists)
+
+    # Max-heap of (-count, pair) entries; stale entries are fixed up lazily when popped
+    heap = [(-count, pair) for pair, count in pairStats.items()]
+    heapify(heap)
+
+    merges = {}
+
+    for i in range(num_of_merges):
+        # Select the most frequent pair for merging
+        while heap:
+            negCount, pair = heappop(heap)
+            count = pairStats[pair]
+            if count == -negCount:
+                break
+            if count > 0:
+                heappush(heap, (-count, pair))
+        else:
+            break
+
+        # Merge the selected pair in the lists that contain it, updating the pair frequencies
+        # incrementally and indexing the lists under the pairs the merge created in them
+        newPairs = set()
+        for listIdx in pairLists.pop(pair):
+            listPairs = set()
+            idLists[listIdx] = mergeAndUpdate(idLists[listIdx], pair, 256 + i, pairStats, frequencies[listIdx], listPairs)
+            for newPair in listPairs:
+                pairLists[newPair].add(listIdx)
+            newPairs |= listPairs
+        merges[pair] = 256 + i
+
+        for newPair in newPairs:
+            heappush(heap, (-pairStats[newPair], newPair))
+
+    return merges
+
+
+def encodeChunk(ids, merge_dict):
+    """
+    Applies learned Byte Pair Encoding (BPE) merges to a list of token IDs.
+
+    This is the encoding core shared by the tokenizers. It repeatedly merges the 
+    adjacent pair with the lowest merge rank until no pair of the list has been 
+    learned, which reproduces the order the merges were learned in. Encoding by 
+    longest vocabulary match instead (e.g. with a trie over the vocabulary) is 
+    not equivalent: a later, longer token can win over the pieces BPE would 
+    have merged first.
+
+    Rather than rescanning the whole list for every merge, the tokens are kept in a 
+    doubly-linked list (index arrays `prv` and `nxt`), and the mergeable pairs in a 
+    heap of (token ID, position) entries. Each pop merges one pair and pushes the at 
+    most two new pairs it forms with its neighbours, so a list of length L is encoded 
+    in O(L log L). Entries whose pair has changed since they were pushed are skipped 
+    when popped. Popping by position within the same token ID merges equal pairs from 
+    left to right, like `merge` does.
+
+    Args:
+        ids (list): A list of token IDs (initially byte values) to encode.
+        merge_dict (dict): A dictionary mapping merged pairs to their token IDs.
+
+    Returns:
+        list: The list of token IDs after applying all possible merges.
+
+    Example:
+        >>> encodeChunk([97, 97, 97, 98], {(97, 97): 256, (256, 97): 257})
+        [257, 98]
+    """
+    # Tuple keys: packed int keys hash no faster, and the heap dominates encode time
+    rank = merge_dict.get
+
+    # Seed the heap with every adjacent pair that has a merge
+    heap = [(rank(pair), i) for i, pair in enumerate(zip(ids, ids[1:])) if pair in merge_dict]
+    if not heap:
+        return ids
+    heapify(heap)
+
+    tokens = list(ids)
+    nxt = list(range(1, len(ids) + 1))
+    nxt[-1] = -1
+    prv = list(range(-1, len(ids) - 1))
+
+    while heap:
+        idx, i = heappop(heap)
+        j = nxt[i]
+
+        # Skip stale entries: the pair at i has changed (or i was merged away) since the push
+        if j == -1 or rank((tokens[i], tokens[j])) != idx:
+            continue
+
+        # Merge the right token into the left one and unlink it
+        tokens[i] = idx
+        tokens[j] = -1
+        k = nxt[j]
+        nxt[i] = k
+
+        # Queue the pairs the new token forms with its neighbours
+        if k != -1:
+            prv[k] = i
+            newIdx = rank((idx, tokens[k]))
+            if newIdx is not None:
+                heappush(heap, (newIdx, i))
+
+        h = prv[i]
+        if h != -1:
+            newIdx = rank((tokens[h], idx))
+            if newIdx is not None:
+                heappush(heap, (newIdx, h))
+
+    # Walk the linked list to collect the remaining tokens
+    encoded = []
+    i = 0
+    while i != -1:
+        encoded.append(tokens[i])
+        i = nxt[i]
+
+    return encoded
+
 if __name__ == "__main__":
 
-    # Test the `getPairStats` and `merge` functions
+    # Test the `getPairStats`, `updatePairStats` and `merge` functions
 
     byteList = [1, 2, 1, 2, 1, 3]
     print(getPairStats(byteList))
 
-    existingStats = {(1, 2): 1}
-    print(getPairStats([1, 2, 1], pairStats=existingStats))
+    existingStats = Counter({(1, 2): 1})
+    updatePairStats([1, 2, 1], existingStats)
+    print(existingStats)
 
     oldList = [1, 2, 3, 1, 2, 4]
     pair = (1, 2)
     idx = 99
     print(merge(oldList, pair, idx))
-    
\ No newline at end of file
+
+    pairStats = getPairStats(oldList)
+    print(mergeAndUpdate(oldList, pair, idx, pairStats), +pairStats)
+
+    print(trainMerges([[97, 97, 97, 98, 100, 97, 97, 97, 98, 97, 99]], 2))
+
+    print(encodeChunk([97, 97, 97, 98], {(97, 97): 256, (256, 97): 257}))
+    
+    # Check `trainMerges` and `encodeChunk` against straightforward reference versions
+    # that recount every pair and rescan every list on each step
+
+    import random
+
+    def referenceTrainMerges(idLists, num_of_merges, frequencies):
+        idLists = [list(ids) for ids in idLists]
+        merges = {}
+        for i in range(num_of_merges):
+            pairStats = Counter()
+            for ids, freq in zip(idLists, frequencies):
+                for pair in zip(ids, ids[1:]):
+                    pairStats[pair] += freq
+            if not pairStats:
+                break
+            # Most frequent pair, ties to the smallest pair
+            pair = min(pairStats, key = lambda p: (-pairStats[p], p))
+            idLists = [merge(ids, pair, 256 + i) for ids in idLists]
+            merges[pair] = 256 + i
+        return merges
+
+    def referenceEncodeChunk(ids, merge_dict):
+        while len(ids) >= 2:
+            # Merge the learned pair with the lowest rank, stopping when there is none
+            pair = min(zip(ids, ids[1:]), key = lambda p: merge_dict.get(p, float("inf")))
+            if pair not in merge_dict:
+                break
+            ids = merge(ids, pair, merge_dict[pair])
+        return ids
+
+    rng = random.Random(0)
+    for _ in range(500):
+        # A small alphabet gives many repeated and tied pairs
+        alphabet = rng.sample(range(256), rng.randint(1, 4))
+        idLists = [[rng.choice(alphabet) for _ in range(rng.randint(0, 30))] for _ in range(rng.randint(1, 5))]
+        frequencies = [rng.randint(1, 3) for _ in idLists]
+        num_of_merges = rng.randint(0, 20)
+
+        merges = trainMerges(idLists, num_of_merges, frequencies)
+        assert merges == referenceTrainMerges(idLists, num_of_merges, frequencies), (idLists, frequencies)
+
+        for ids in idLists:
+            assert encodeChunk(list(ids), merges) == referenceEncodeChunk(list(ids), merges), (ids, merges)
+
+    print("trainMerges and encodeChunk match the reference versions")